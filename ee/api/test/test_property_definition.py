@@ -7,6 +7,9 @@ from rest_framework import status
 
 from ee.models.license import License, LicenseManager
 from ee.models.property_definition import EnterprisePropertyDefinition
+from posthog.hogql.context import HogQLContext
+from posthog.hogql.parser import parse_select
+from posthog.hogql.printer import print_ast
 from posthog.models import EventProperty, Tag, ActivityLog
 from posthog.models.property_definition import PropertyDefinition
 from posthog.test.base import APIBaseTest
@@ -207,6 +210,28 @@ class TestPropertyDefinitionEnterpriseAPI(APIBaseTest):
         self.assertEqual(response_data["is_numerical"], False)
         self.assertEqual(response_data["updated_by"]["first_name"], self.user.first_name)
 
+    def test_update_property_definition_property_type_invalidates_hogql_property_types(self):
+        super(LicenseManager, cast(LicenseManager, License.objects)).create(
+            plan="enterprise", valid_until=timezone.datetime(2038, 1, 19, 3, 14, 7)
+        )
+        property = PropertyDefinition.objects.create(team=self.team, name="property", property_type="String")
+
+        def print_select() -> str:
+            return print_ast(
+                parse_select("select properties.property from events"),
+                HogQLContext(team_id=self.team.pk, enable_select_queries=True),
+                "clickhouse",
+            )
+
+        self.assertNotIn("toFloat64OrNull", print_select())
+
+        response = self.client.patch(
+            f"/api/projects/@current/property_definitions/{str(property.id)}/", {"property_type": "Numeric"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertIn("toFloat64OrNull", print_select())
+
     def test_update_property_description_without_license(self):
         property = EnterprisePropertyDefinition.objects.create(team=self.team, name="enterprise property")
         response = self.client.patch(
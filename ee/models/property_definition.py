@@ -1,7 +1,9 @@
 from django.contrib.postgres.fields import ArrayField
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 
 from posthog.models.property_definition import PropertyDefinition
+from posthog.models.signals import mutable_receiver
 
 
 class EnterprisePropertyDefinition(PropertyDefinition):
@@ -14,3 +16,11 @@ class EnterprisePropertyDefinition(PropertyDefinition):
     deprecated_tags_v2: ArrayField = ArrayField(
         models.CharField(max_length=32), null=True, blank=True, default=None, db_column="tags"
     )
+
+
+# Signals for subclasses are only sent with the subclass as sender, so PropertyDefinition's receiver doesn't fire
+@mutable_receiver([post_save, post_delete], sender=EnterprisePropertyDefinition)
+def enterprise_property_definition_changed(sender, instance, **kwargs):
+    from posthog.hogql.transforms.property_types import invalidate_property_types_cache
+
+    invalidate_property_types_cache(instance.team_id)
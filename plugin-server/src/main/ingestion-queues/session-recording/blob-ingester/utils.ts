@@ -3,10 +3,14 @@ import zlib from 'node:zlib'
 import { status } from '../../../../utils/status'
 import { IncomingRecordingMessage, PersistedRecordingMessage } from './types'
 
+// Compressed data used to be utf-16 encoded, it's now utf-8 and prefixed with this marker byte.
+// Gzip data always starts with 0x1f, so older data can't be mistaken for the new format.
+const UTF8_COMPRESSION_MARKER = 0x01
+
 // NOTE: These functions are meant to be identical to those in posthog/session_recordings/session_recording_helpers.py
 export function compressToString(input: string): string {
-    const compressed_data = zlib.gzipSync(Buffer.from(input, 'utf16le'))
-    return compressed_data.toString('base64')
+    const compressed_data = zlib.gzipSync(Buffer.from(input, 'utf8'), { level: 1 })
+    return Buffer.concat([Buffer.from([UTF8_COMPRESSION_MARKER]), compressed_data]).toString('base64')
 }
 
 export function decompressFromString(input: string, doubleDecode = false): string {
@@ -15,9 +19,10 @@ export function decompressFromString(input: string, doubleDecode = false): strin
     }
     const compressedData = Buffer.from(input, 'base64')
     try {
-        const uncompressed = zlib.gunzipSync(compressedData)
+        const isUtf8 = compressedData[0] === UTF8_COMPRESSION_MARKER
+        const uncompressed = zlib.gunzipSync(isUtf8 ? compressedData.subarray(1) : compressedData)
         // Trim is a quick way to get rid of BOMs created by python
-        const finalUncompressed = uncompressed.toString('utf16le').trim()
+        const finalUncompressed = uncompressed.toString(isUtf8 ? 'utf8' : 'utf16le').trim()
         if (doubleDecode) {
             status.warn('🪞', 'double decoding was necessary while decompressing snapshot data', {
                 finalUncompressed,
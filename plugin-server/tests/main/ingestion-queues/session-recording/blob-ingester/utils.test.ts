@@ -20,6 +20,15 @@ describe('compression', () => {
         )
     })
 
+    it('should decompress utf-8 string from the python version', () => {
+        const decompressed = decompressFromString(
+            'AR+LCADsSdFqBP8tjEsKgDAMRK8iWbtQ669ewgOIi6IVutAWE0EpvbsjuMqbN0ymSPIES0Om8oxWIwYYif11Lp8tYYNnJ84fjDxFunHaTqN4QJ0uQG4Ffh/E7XbcNrYCUaQ5/Y7F7AGqxLJpda0rpfo0v/TycjZ/AAAA'
+        )
+        expect(decompressed).toEqual(
+            `[{"type": 3, "data": {"source": 1, "positions": [{"x": 679, "y": 790, "id": 3, "timeOffset": 0}]}, "timestamp": 1679569492338}]`
+        )
+    })
+
     it('decompress doubly base64 encoded string', () => {
         const doublyEncoded: string = btoa(compressedData)
         const decompressed = decompressFromString(doublyEncoded)
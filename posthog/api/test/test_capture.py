@@ -35,6 +35,7 @@ from posthog.api.capture import (
 from posthog.api.test.mock_sentry import mock_sentry_context_for_tagging
 from posthog.api.test.openapi_validation import validate_response
 from posthog.kafka_client.topics import KAFKA_SESSION_RECORDING_EVENTS
+from posthog.session_recordings.session_recording_helpers import decompress
 from posthog.settings import (
     DATA_UPLOAD_MAX_MEMORY_SIZE,
     KAFKA_EVENTS_PLUGIN_INGESTION_TOPIC,
@@ -1225,9 +1226,7 @@ class TestCapture(BaseTest):
         data_sent_to_kafka = json.loads(kafka_produce.call_args_list[0][1]["data"]["data"])
 
         # Decompress the data sent to kafka to compare it to the original data
-        decompressed_data = gzip.decompress(
-            base64.b64decode(data_sent_to_kafka["properties"]["$snapshot_data"]["data"])
-        ).decode("utf-16", "surrogatepass")
+        decompressed_data = decompress(data_sent_to_kafka["properties"]["$snapshot_data"]["data"])
         data_sent_to_kafka["properties"]["$snapshot_data"]["data"] = decompressed_data
 
         self.assertEqual(
@@ -11,6 +11,8 @@ from posthog.session_recordings.session_recording_helpers import (
     SnapshotData,
     SnapshotDataTaggedWithWindowId,
     compress_and_chunk_snapshots,
+    compress_to_string,
+    decompress,
     decompress_chunked_snapshot_data,
     generate_inactive_segments_for_range,
     get_active_segments_from_event_list,
@@ -107,7 +109,7 @@ def test_compression_and_chunking(raw_snapshot_events, mocker: MockerFixture):
                     "chunk_count": 1,
                     "data": "H4sIAAAAAAAC/2WMywpAUABEz6fori28k1+RhQVlIYoN8uuY+9hpaprONPM+LReGnYOVQakhIiOWWzoxi25KvdIa+pSSgoqcRKqde91u+X/Mw+PIInlmONXbZ6Ndxwc14H+ijAAAAA==",
                     "compression": "gzip-base64",
-                    "data": "H4sIAAAAAAAC//v/L5qhmkGJoYShkqGAIRXIsmJQYDBi0AGSINFMhlygaDGQlQhkFUDlDRlMGUwYzBiMGQyA0AJMQmAtWCemicYUmBjLAAABQ+l7pgAAAA==",
+                    "data": "AR+LCAAAAAAABP+LrlYqqSxIVbJSMNJRUCrJzE0tLknMLQDyDU1NzIwNDCwMQKBWRwGu0BivwlgAxoDEXlIAAAA=",
                     "has_full_snapshot": True,
                     "events_summary": [
                         {"timestamp": MILLISECOND_TIMESTAMP, "type": 2, "data": {}},
@@ -133,6 +135,20 @@ def test_decompression_results_in_same_data(raw_snapshot_events):
     ]
 
 
+def test_decompress_legacy_utf16_data():
+    # Data compressed before switching to utf-8, e.g. chunks already stored in ClickHouse
+    compressed_data = "H4sIAFUyHGQC/1WOwQ6CMBBE36cYzh5QFMWf8AOMB6KQ9IASC4nE+OvqlK4kpNl2OjO7O9/PiRcJHQMtldCBBRlL3QlXSimlscHnudPz4DJ5V+ZtpXic/E7oJhz1OP9pv5wdhXUMxgUmNc5p5zxDmNdo25Faxwt15kh5c1bNfX5M3CjPP1/cudVbsFGtNTtjP3b/AMlNphkAAQAA"
+    assert (
+        decompress(compressed_data)
+        == '[{"type": 3, "data": {"source": 1, "positions": [{"x": 679, "y": 790, "id": 3, "timeOffset": 0}]}, "timestamp": 1679569492338}]'
+    )
+
+
+def test_compress_and_decompress_non_ascii_data():
+    json_string = '{"text": "żółć 🦔"}'
+    assert decompress(compress_to_string(json_string)) == json_string
+
+
 def test_has_full_snapshot_property(raw_snapshot_events):
     compressed = list(compress_and_chunk_snapshots(raw_snapshot_events))
     assert len(compressed) == 1
@@ -361,6 +377,36 @@ def test_get_active_segments_from_no_active_events():
     assert active_segments == []
 
 
+def test_get_active_segments_from_event_list_uses_rrweb_sources():
+    base_time = datetime(2019, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
+    timestamp = round(base_time.timestamp() * 1000)
+    events = [
+        SessionRecordingEventSummary(timestamp=timestamp, type=3, data={"source": 12}),  # Drag
+        SessionRecordingEventSummary(timestamp=timestamp + 100_000, type=3, data={"source": 10}),  # Font
+    ]
+    active_segments = get_active_segments_from_event_list(events, window_id="1", activity_threshold_seconds=60)
+    assert active_segments == [
+        RecordingSegment(start_time=base_time, end_time=base_time, window_id="1", is_active=True)
+    ]
+
+
+def test_get_active_segments_from_event_list_with_float_timestamps():
+    timestamp = MILLISECOND_TIMESTAMP + 0.5
+    events = [
+        SessionRecordingEventSummary(timestamp=timestamp, type=3, data={"source": 1}),
+        SessionRecordingEventSummary(timestamp=timestamp + 1000, type=3, data={"source": 1}),
+    ]
+    active_segments = get_active_segments_from_event_list(events, window_id="1", activity_threshold_seconds=60)
+    assert active_segments == [
+        RecordingSegment(
+            start_time=datetime.fromtimestamp(timestamp / 1000, timezone.utc),
+            end_time=datetime.fromtimestamp((timestamp + 1000) / 1000, timezone.utc),
+            window_id="1",
+            is_active=True,
+        )
+    ]
+
+
 def test_generate_inactive_segments_for_range():
     base_time = datetime(2019, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
     generated_segments = generate_inactive_segments_for_range(
@@ -1,101 +1,236 @@
-from typing import Dict, Set
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import DefaultDict, Dict, List, Optional, Set, Tuple
+
+from django.core.cache import cache
+from django.db.models import Q
 
 from posthog.hogql import ast
 from posthog.hogql.context import HogQLContext
 from posthog.hogql.database.models import DateTimeDatabaseField
-from posthog.hogql.parser import parse_expr
 from posthog.hogql.visitor import CloningVisitor, TraversingVisitor
 
+# Property definitions are also written by the plugin server, which doesn't trigger the signals below,
+# so cached types are only trusted for this long.
+PROPERTY_TYPES_CACHE_TTL_SECONDS = 60
 
-def resolve_property_types(node: ast.Expr, context: HogQLContext = None) -> ast.Expr:
-    from posthog.models import PropertyDefinition
+# Bumped in the shared cache whenever a team's property definitions change through Django,
+# so every worker stops using its cached types for that team.
+PROPERTY_TYPES_VERSION_CACHE_KEY = "hogql_property_types_version_{team_id}"
+_fetch_locks: Dict[Tuple, threading.Lock] = {}
+_fetch_locks_lock = threading.Lock()
 
+
+def resolve_property_types(node: ast.Expr, context: HogQLContext = None) -> ast.Expr:
     # find all properties
     property_finder = PropertyFinder()
     property_finder.visit(node)
 
     # fetch them
-    event_property_values = (
-        PropertyDefinition.objects.filter(
-            name__in=property_finder.event_properties,
-            team_id=context.team_id,
-            type__in=[None, PropertyDefinition.Type.EVENT],
-        ).values_list("name", "property_type")
-        if property_finder.event_properties
-        else []
+    event_properties, person_properties = get_property_types(
+        context.team_id,
+        tuple(sorted(property_finder.event_properties)),
+        tuple(sorted(property_finder.person_properties)),
     )
-    event_properties = {name: property_type for name, property_type in event_property_values if property_type}
-
-    person_property_values = (
-        PropertyDefinition.objects.filter(
-            name__in=property_finder.person_properties,
-            team_id=context.team_id,
-            type=PropertyDefinition.Type.PERSON,
-        ).values_list("name", "property_type")
-        if property_finder.person_properties
-        else []
-    )
-    person_properties = {name: property_type for name, property_type in person_property_values if property_type}
 
     # swap them out
-    if len(event_properties) == 0 and len(person_properties) == 0 and not property_finder.found_timestamps:
+    if len(event_properties) == 0 and len(person_properties) == 0 and not property_finder.timestamp_fields:
         return node
 
     timezone = context.database.get_timezone() if context and context.database else "UTC"
     property_swapper = PropertySwapper(
-        timezone=timezone, event_properties=event_properties, person_properties=person_properties
+        timezone=timezone,
+        event_properties=event_properties,
+        person_properties=person_properties,
+        property_finder=property_finder,
     )
+    if not property_swapper.replacements:
+        return node
     return property_swapper.visit(node)
 
 
+def get_property_types(
+    team_id: int, event_property_names: Tuple[str, ...], person_property_names: Tuple[str, ...]
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Returns the types of the given event and person properties, as `{name: property_type}` dicts.
+    The returned dicts are shared between callers and must not be modified.
+    """
+    if not event_property_names and not person_property_names:
+        return {}, {}
+
+    key = (
+        team_id,
+        cache.get(PROPERTY_TYPES_VERSION_CACHE_KEY.format(team_id=team_id), 0),
+        int(time.monotonic() // PROPERTY_TYPES_CACHE_TTL_SECONDS),
+        event_property_names,
+        person_property_names,
+    )
+    # Only let one thread query the database for the same key, the others wait and then read from the cache
+    with _fetch_locks_lock:
+        lock = _fetch_locks.setdefault(key, threading.Lock())
+    with lock:
+        try:
+            return _fetch_property_types(*key)
+        finally:
+            with _fetch_locks_lock:
+                _fetch_locks.pop(key, None)
+
+
+@lru_cache(maxsize=512)
+def _fetch_property_types(
+    team_id: int,
+    version: int,
+    time_bucket: int,
+    event_property_names: Tuple[str, ...],
+    person_property_names: Tuple[str, ...],
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    from posthog.models import PropertyDefinition
+
+    # fetch both event and person properties in one round trip
+    event_properties: Dict[str, str] = {}
+    person_properties: Dict[str, str] = {}
+    query = Q()
+    if event_property_names:
+        query |= Q(type__in=[None, PropertyDefinition.Type.EVENT], name__in=event_property_names)
+    if person_property_names:
+        query |= Q(type=PropertyDefinition.Type.PERSON, name__in=person_property_names)
+    property_values = (
+        PropertyDefinition.objects.filter(team_id=team_id)
+        .filter(query)
+        .values_list("name", "type", "property_type")
+    )
+    for name, type, property_type in property_values:
+        if not property_type:
+            continue
+        if type == PropertyDefinition.Type.PERSON:
+            person_properties[name] = property_type
+        else:
+            event_properties[name] = property_type
+    return event_properties, person_properties
+
+
+def invalidate_property_types_cache(team_id: int) -> None:
+    key = PROPERTY_TYPES_VERSION_CACHE_KEY.format(team_id=team_id)
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+# NOTE: This is purely for testing purposes
+def TEST_clear_property_types_cache():
+    _fetch_property_types.cache_clear()
+
+
+PERSON_TABLES = ("persons", "raw_persons")
+
+
+def _resolve_hogql_table(table_type: ast.BaseTableType, table_name_cache: Dict[int, str]) -> str:
+    """Resolves the HogQL table name of a table type, memoized by the id of the type node."""
+    table_name = table_name_cache.get(id(table_type))
+    if table_name is None:
+        table_name = table_type.resolve_database_table().hogql_table()
+        table_name_cache[id(table_type)] = table_name
+    return table_name
+
+
 class PropertyFinder(TraversingVisitor):
+    """Finds all properties and timestamps in the query, and remembers the fields that reference them"""
+
     def __init__(self):
         super().__init__()
         self.person_properties: Set[str] = set()
         self.event_properties: Set[str] = set()
-        self.found_timestamps = False
+        self.person_property_fields: DefaultDict[str, List[ast.Field]] = defaultdict(list)
+        self.event_property_fields: DefaultDict[str, List[ast.Field]] = defaultdict(list)
+        self.timestamp_fields: List[ast.Field] = []
+        # ids of the expressions containing each of the fields above, from the root down to the field itself
+        self.field_ancestor_ids: Dict[int, List[int]] = {}
+        self.table_name_cache: Dict[int, str] = {}
+        self._expr_stack: List[int] = []
+
+    def visit(self, node: ast.AST):
+        if not isinstance(node, ast.Expr):
+            return super().visit(node)
+        self._expr_stack.append(id(node))
+        super().visit(node)
+        self._expr_stack.pop()
 
     def visit_property_type(self, node: ast.PropertyType):
-        if node.field_type.name == "properties" and len(node.chain) == 1:
-            if isinstance(node.field_type.table_type, ast.BaseTableType):
-                table = node.field_type.table_type.resolve_database_table().hogql_table()
-                if table == "persons" or table == "raw_persons":
-                    self.person_properties.add(node.chain[0])
-                if table == "events":
-                    self.event_properties.add(node.chain[0])
+        table = self._get_properties_table(node)
+        if table in PERSON_TABLES:
+            self.person_properties.add(node.chain[0])
+        elif table == "events":
+            self.event_properties.add(node.chain[0])
 
     def visit_field(self, node: ast.Field):
+        type = node.type
+        if isinstance(type, ast.PropertyType):
+            # Handled here instead of in visit_property_type, so the table is only resolved once per field
+            table = self._get_properties_table(type)
+            if table in PERSON_TABLES:
+                self.person_properties.add(type.chain[0])
+                self._add_field(self.person_property_fields[type.chain[0]], node)
+            elif table == "events":
+                self.event_properties.add(type.chain[0])
+                self._add_field(self.event_property_fields[type.chain[0]], node)
+            return
+
         super().visit_field(node)
-        if isinstance(node.type, ast.FieldType) and isinstance(
-            node.type.resolve_database_field(), DateTimeDatabaseField
-        ):
-            self.found_timestamps = True
+        if isinstance(type, ast.FieldType) and isinstance(type.resolve_database_field(), DateTimeDatabaseField):
+            self._add_field(self.timestamp_fields, node)
+
+    def _get_properties_table(self, node: ast.PropertyType) -> Optional[str]:
+        if node.field_type.name == "properties" and len(node.chain) == 1:
+            if isinstance(node.field_type.table_type, ast.BaseTableType):
+                return _resolve_hogql_table(node.field_type.table_type, self.table_name_cache)
+        return None
+
+    def _add_field(self, fields: List[ast.Field], node: ast.Field):
+        fields.append(node)
+        self.field_ancestor_ids[id(node)] = list(self._expr_stack)
 
 
 class PropertySwapper(CloningVisitor):
-    def __init__(self, timezone: str, event_properties: Dict[str, str], person_properties: Dict[str, str]):
+    """Swaps out the fields found by the PropertyFinder, cloning only the expressions that lead to them"""
+
+    def __init__(
+        self,
+        timezone: str,
+        event_properties: Dict[str, str],
+        person_properties: Dict[str, str],
+        property_finder: PropertyFinder,
+    ):
         super().__init__(clear_types=False)
         self.timezone = timezone
-        self.event_properties = event_properties
-        self.person_properties = person_properties
-
-    def visit_field(self, node: ast.Field):
-        if isinstance(node.type, ast.FieldType):
-            if isinstance(node.type.resolve_database_field(), DateTimeDatabaseField):
-                return ast.Call(name="toTimeZone", args=[node, ast.Constant(value=self.timezone)])
-
-        type = node.type
-        if isinstance(type, ast.PropertyType) and type.field_type.name == "properties" and len(type.chain) == 1:
-            if isinstance(type.field_type.table_type, ast.BaseTableType):
-                table = type.field_type.table_type.resolve_database_table().hogql_table()
-                if table == "persons" or table == "raw_persons":
-                    if type.chain[0] in self.person_properties:
-                        return self._add_type_to_string_field(node, self.person_properties[type.chain[0]])
-                if table == "events":
-                    if type.chain[0] in self.event_properties:
-                        return self._add_type_to_string_field(node, self.event_properties[type.chain[0]])
-
-        return node
+        self.replacements: Dict[int, ast.Expr] = {}
+        for node in property_finder.timestamp_fields:
+            self.replacements[id(node)] = ast.Call(name="toTimeZone", args=[node, ast.Constant(value=timezone)])
+        for name, property_type in person_properties.items():
+            for node in property_finder.person_property_fields.get(name, []):
+                self._add_replacement(node, self._add_type_to_string_field(node, property_type))
+        for name, property_type in event_properties.items():
+            for node in property_finder.event_property_fields.get(name, []):
+                self._add_replacement(node, self._add_type_to_string_field(node, property_type))
+
+        # Only the expressions leading to a swapped field need to be cloned, the rest of the tree is left untouched
+        self.ancestor_ids: Set[int] = set()
+        for node_id in self.replacements:
+            self.ancestor_ids.update(property_finder.field_ancestor_ids[node_id])
+
+    def visit(self, node: ast.AST):
+        if isinstance(node, ast.Expr):
+            replacement = self.replacements.get(id(node))
+            if replacement is not None:
+                return replacement
+            if id(node) not in self.ancestor_ids:
+                return node
+        return super().visit(node)
+
+    def _add_replacement(self, node: ast.Field, replacement: ast.Expr):
+        if replacement is not node:
+            self.replacements[id(node)] = replacement
 
     def _add_type_to_string_field(self, node: ast.Field, type: str):
         if type == "DateTime":
@@ -103,5 +238,5 @@ class PropertySwapper(CloningVisitor):
         if type == "Numeric":
             return ast.Call(name="toFloat", args=[node])
         if type == "Boolean":
-            return parse_expr("{node} = 'true'", {"node": node})
+            return ast.CompareOperation(op=ast.CompareOperationOp.Eq, left=node, right=ast.Constant(value="true"))
         return node
@@ -1,8 +1,20 @@
+from django.core.cache import cache
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
+from posthog.hogql import ast
 from posthog.hogql.context import HogQLContext
-from posthog.hogql.parser import parse_select
+from posthog.hogql.database.database import create_hogql_database
+from posthog.hogql.parser import parse_expr, parse_select
 from posthog.hogql.printer import print_ast
+from posthog.hogql.resolver import resolve_types
+from posthog.hogql.transforms.property_types import (
+    PROPERTY_TYPES_VERSION_CACHE_KEY,
+    PropertyFinder,
+    PropertySwapper,
+    resolve_property_types,
+)
 from posthog.models import PropertyDefinition
 from posthog.test.base import BaseTest
 
@@ -94,6 +106,45 @@ class TestPropertyTypes(BaseTest):
         )
         self.assertEqual(printed, expected)
 
+    def test_resolve_property_types_cached(self):
+        select = "select properties.$screen_width, properties.bool from events"
+        printed = self._print_select(select)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._print_select(select), printed)
+        self.assertFalse(any("posthog_propertydefinition" in query["sql"] for query in queries.captured_queries))
+
+        PropertyDefinition.objects.filter(team=self.team, name="bool").get().delete()
+        printed_after_delete = self._print_select(select)
+        self.assertNotEqual(printed_after_delete, printed)
+        self.assertNotIn("equals(replaceRegexpAll", printed_after_delete)
+
+    def test_resolve_property_types_version_is_shared_between_workers(self):
+        select = "select properties.bool from events"
+        printed = self._print_select(select)
+
+        # update without signals, and then bump the version in the shared cache like another worker's signal would
+        PropertyDefinition.objects.filter(team=self.team, name="bool").update(property_type="String")
+        self.assertEqual(self._print_select(select), printed)
+
+        cache.incr(PROPERTY_TYPES_VERSION_CACHE_KEY.format(team_id=self.team.pk))
+        self.assertNotIn("equals(replaceRegexpAll", self._print_select(select))
+
+    def test_resolve_property_types_leaves_query_without_swaps_untouched(self):
+        expr = resolve_types(
+            parse_select("select properties.$initial_browser from raw_persons"), create_hogql_database(self.team.pk)
+        )
+        self.assertIs(resolve_property_types(expr, HogQLContext(team_id=self.team.pk)), expr)
+
+    def test_boolean_property_comparison_matches_parser(self):
+        field = ast.Field(chain=["properties", "bool"])
+        swapper = PropertySwapper(
+            timezone="UTC", event_properties={}, person_properties={}, property_finder=PropertyFinder()
+        )
+        self.assertEqual(
+            swapper._add_type_to_string_field(field, "Boolean"),
+            parse_expr("{node} = 'true'", {"node": field}),
+        )
+
     def _print_select(self, select: str):
         expr = parse_select(select)
         return print_ast(expr, HogQLContext(team_id=self.team.pk, enable_select_queries=True), "clickhouse")
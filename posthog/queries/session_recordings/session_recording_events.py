@@ -1,5 +1,8 @@
 import json
 from datetime import datetime
+from heapq import merge
+from itertools import chain
+from operator import itemgetter
 from typing import Dict, List, Optional, Tuple, cast
 
 from statshog.defaults.django import statsd
@@ -16,12 +19,14 @@ from posthog.models.session_recording.metadata import (
     WindowId,
 )
 from posthog.session_recordings.session_recording_helpers import (
+    RRWEB_MAP_EVENT_DATA_SOURCE,
+    RRWEB_MAP_EVENT_TYPE,
     decompress_chunked_snapshot_data,
     generate_inactive_segments_for_range,
     get_active_segments_from_event_list,
     parse_snapshot_timestamp,
+    sort_window_ids_by_start_time,
 )
-from posthog.utils import flatten
 
 
 class SessionRecordingEvents:
@@ -150,7 +155,7 @@ class SessionRecordingEvents:
             )
 
         for window_id in events_summary_by_window_id:
-            events_summary_by_window_id[window_id].sort(key=lambda x: x["timestamp"])
+            events_summary_by_window_id[window_id].sort(key=itemgetter("timestamp"))
 
         # If any of the snapshots are missing the events_summary field, we fallback to the old parsing method
         if any(len(x) == 0 for x in events_summary_by_window_id.values()):
@@ -173,8 +178,10 @@ class SessionRecordingEvents:
             self._team.pk, self._session_recording_id, all_snapshots, return_only_activity_data=True
         )
 
+        # Each window's events are concatenated from separately sorted chunks, so sort them as a whole.
+        # _get_metadata_from_events_summary relies on each window's events being in order
         events_summary_by_window_id = {
-            window_id: cast(List[SessionRecordingEventSummary], event_list)
+            window_id: sorted(cast(List[SessionRecordingEventSummary], event_list), key=itemgetter("timestamp"))
             for window_id, event_list in decompressed_recording_data["snapshot_data_by_window_id"].items()
         }
 
@@ -211,12 +218,10 @@ class SessionRecordingEvents:
         start_and_end_times_by_window_id: Dict[WindowId, RecordingSegment] = {}
 
         # Get the active segments for each window_id
-        all_active_segments: List[RecordingSegment] = []
+        active_segments_by_window_id: List[List[RecordingSegment]] = []
 
         for window_id, events_summary in events_summary_by_window_id.items():
-            active_segments_for_window_id = get_active_segments_from_event_list(events_summary, window_id)
-
-            all_active_segments.extend(active_segments_for_window_id)
+            active_segments_by_window_id.append(get_active_segments_from_event_list(events_summary, window_id))
 
             start_and_end_times_by_window_id[window_id] = RecordingSegment(
                 window_id=window_id,
@@ -225,20 +230,21 @@ class SessionRecordingEvents:
                 is_active=False,  # We don't know yet
             )
 
-        # Sort the active segments by start time. This will interleave active segments
-        # from different windows
-        all_active_segments.sort(key=lambda segment: segment["start_time"])
+        # Merge the active segments, which are sorted per window as the events are, by start time. This will interleave
+        # active segments from different windows
+        all_active_segments: List[RecordingSegment] = list(
+            merge(*active_segments_by_window_id, key=itemgetter("start_time"))
+        )
 
         # These start and end times are used to make sure the segments span the entire recording
-        first_start_time = min([cast(datetime, x["start_time"]) for x in start_and_end_times_by_window_id.values()])
-        last_end_time = max([cast(datetime, x["end_time"]) for x in start_and_end_times_by_window_id.values()])
+        first_start_time = min(cast(datetime, x["start_time"]) for x in start_and_end_times_by_window_id.values())
+        last_end_time = max(cast(datetime, x["end_time"]) for x in start_and_end_times_by_window_id.values())
 
         # Now, we fill in the gaps between the active segments with inactive segments
         all_segments: List[RecordingSegment] = []
         current_timestamp = first_start_time
-        current_window_id: WindowId = sorted(
-            start_and_end_times_by_window_id, key=lambda x: start_and_end_times_by_window_id[x]["start_time"]
-        )[0]
+        window_ids_by_start_time = sort_window_ids_by_start_time(start_and_end_times_by_window_id)
+        current_window_id: WindowId = window_ids_by_start_time[0]
 
         for index, segment in enumerate(all_active_segments):
             # It's possible that segments overlap and we don't need to fill a gap
@@ -250,6 +256,7 @@ class SessionRecordingEvents:
                         current_window_id,
                         start_and_end_times_by_window_id,
                         is_first_segment=index == 0,
+                        window_ids_by_start_time=window_ids_by_start_time,
                     )
                 )
             all_segments.append(segment)
@@ -266,18 +273,25 @@ class SessionRecordingEvents:
                     start_and_end_times_by_window_id,
                     is_last_segment=True,
                     is_first_segment=current_timestamp == first_start_time,
+                    window_ids_by_start_time=window_ids_by_start_time,
                 )
             )
 
-        all_events_summary: List[SessionRecordingEventSummary] = list(
-            flatten(list(events_summary_by_window_id.values()))
-        )
-
-        click_count = len([x for x in all_events_summary if x["type"] == 3 and x["data"]["source"] == 2])
-        keypress_count = len([x for x in all_events_summary if x["type"] == 3 and x["data"]["source"] == 5])
-        urls: List[str] = [
-            cast(str, x["data"]["href"]) for x in all_events_summary if isinstance(x.get("data", {}).get("href"), str)
-        ]
+        # Count clicks and keypresses and collect urls in a single pass over the events
+        click_count = 0
+        keypress_count = 0
+        urls: List[str] = []
+        for event_summary in chain.from_iterable(events_summary_by_window_id.values()):
+            data = event_summary.get("data") or {}
+            if event_summary["type"] == RRWEB_MAP_EVENT_TYPE.IncrementalSnapshot:
+                source = data.get("source")
+                if source == RRWEB_MAP_EVENT_DATA_SOURCE.MouseInteraction:
+                    click_count += 1
+                elif source == RRWEB_MAP_EVENT_DATA_SOURCE.Input:
+                    keypress_count += 1
+            href = data.get("href")
+            if isinstance(href, str):
+                urls.append(href)
 
         return RecordingMetadata(
             distinct_id="",  # Will be added by the caller
@@ -1,11 +1,14 @@
 import base64
 import dataclasses
 import gzip
+import io
 import json
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
+from operator import itemgetter
 from typing import Any, DefaultDict, Dict, Generator, List, Optional
 
+import numpy as np
 from dateutil.parser import parse, ParserError
 from prometheus_client import Histogram
 from prometheus_client.utils import INF
@@ -58,11 +61,11 @@ class RRWEB_MAP_EVENT_DATA_SOURCE:
     MediaInteraction = 7
     StyleSheetRule = 8
     CanvasMutation = 9
-    Font = 1
-    Log = 1
-    Drag = 1
-    StyleDeclaration = 1
-    Selection = 1
+    Font = 10
+    Log = 11
+    Drag = 12
+    StyleDeclaration = 13
+    Selection = 14
 
 
 # event.data.type
@@ -93,6 +96,13 @@ EVENT_SUMMARY_DATA_INCLUSIONS = [
     "payload.href",
     "payload.level",
 ]
+EVENT_SUMMARY_DATA_KEYS = frozenset(key for key in EVENT_SUMMARY_DATA_INCLUSIONS if "." not in key)
+EVENT_SUMMARY_PAYLOAD_KEYS = frozenset(
+    key.split(".", 1)[1] for key in EVENT_SUMMARY_DATA_INCLUSIONS if key.startswith("payload.")
+)
+# Most events (e.g. mutations) have none of the included keys, so their summaries all share this dict.
+# It must never be modified.
+EMPTY_EVENT_SUMMARY_DATA: Dict = {}
 
 
 Event = Dict[str, Any]
@@ -168,14 +178,31 @@ def is_unchunked_snapshot(event: Dict) -> bool:
         raise ValueError('$snapshot events must contain property "$snapshot_data"!')
 
 
+# Compressed data used to be utf-16 encoded, it's now utf-8 and prefixed with this marker byte.
+# Gzip data always starts with 0x1f, so older data can't be mistaken for the new format.
+UTF8_COMPRESSION_MARKER = b"\x01"
+COMPRESSION_CHUNK_SIZE = 64 * 1024
+
+
 def compress_to_string(json_string: str) -> str:
-    compressed_data = gzip.compress(json_string.encode("utf-16", "surrogatepass"))
-    return base64.b64encode(compressed_data).decode("utf-8")
+    # Stream the string into the compressor in chunks, so we never hold a full encoded copy of it in memory
+    buffer = io.BytesIO()
+    buffer.write(UTF8_COMPRESSION_MARKER)
+    # The fastest compression level, as snapshots are large and compressing them at the default level 9 is slow
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=1) as gzip_file:
+        for offset in range(0, len(json_string), COMPRESSION_CHUNK_SIZE):
+            gzip_file.write(json_string[offset : offset + COMPRESSION_CHUNK_SIZE].encode("utf-8", "surrogatepass"))
+    return base64.b64encode(buffer.getbuffer()).decode("utf-8")
 
 
 def decompress(base64data: str) -> str:
-    compressed_bytes = base64.b64decode(base64data)
-    return gzip.decompress(compressed_bytes).decode("utf-16", "surrogatepass")
+    buffer = io.BytesIO(base64.b64decode(base64data))
+    if buffer.read(1) == UTF8_COMPRESSION_MARKER:
+        with gzip.GzipFile(fileobj=buffer, mode="rb") as gzip_file:
+            return gzip_file.read().decode("utf-8", "surrogatepass")
+    buffer.seek(0)
+    with gzip.GzipFile(fileobj=buffer, mode="rb") as gzip_file:
+        return gzip_file.read().decode("utf-16", "surrogatepass")
 
 
 def decompress_chunked_snapshot_data(
@@ -277,21 +304,28 @@ def decompress_chunked_snapshot_data(
     return DecompressedRecordingData(has_next=has_next, snapshot_data_by_window_id=snapshot_data_by_window_id)
 
 
+ACTIVE_RR_WEB_SOURCES = frozenset(
+    [
+        RRWEB_MAP_EVENT_DATA_SOURCE.MouseMove,
+        RRWEB_MAP_EVENT_DATA_SOURCE.MouseInteraction,
+        RRWEB_MAP_EVENT_DATA_SOURCE.Scroll,
+        RRWEB_MAP_EVENT_DATA_SOURCE.ViewportResize,
+        RRWEB_MAP_EVENT_DATA_SOURCE.Input,
+        RRWEB_MAP_EVENT_DATA_SOURCE.TouchMove,
+        RRWEB_MAP_EVENT_DATA_SOURCE.MediaInteraction,
+        RRWEB_MAP_EVENT_DATA_SOURCE.Drag,
+    ]
+)
+
+
 def is_active_event(event: SessionRecordingEventSummary) -> bool:
     """
     Determines which rr-web events are "active" - meaning user generated
     """
-    active_rr_web_sources = [
-        1,  # MouseMove,
-        2,  # MouseInteraction,
-        3,  # Scroll,
-        4,  # ViewportResize,
-        5,  # Input,
-        6,  # TouchMove,
-        7,  # MediaInteraction,
-        12,  # Drag,
-    ]
-    return event["type"] == 3 and event["data"].get("source") in active_rr_web_sources
+    return (
+        event["type"] == RRWEB_MAP_EVENT_TYPE.IncrementalSnapshot
+        and event["data"].get("source") in ACTIVE_RR_WEB_SOURCES
+    )
 
 
 def parse_snapshot_timestamp(timestamp: int):
@@ -311,33 +345,28 @@ def get_active_segments_from_event_list(
     the segments of the recording where the user is "active". And active segment ends
     when there isn't another active event for activity_threshold_seconds seconds
     """
-    active_event_timestamps = [event["timestamp"] for event in event_list if is_active_event(event)]
-
-    active_recording_segments: List[RecordingSegment] = []
-    current_active_segment: Optional[RecordingSegment] = None
-    for current_timestamp_int in active_event_timestamps:
-        current_timestamp = parse_snapshot_timestamp(current_timestamp_int)
-        # If the time since the last active event is less than the threshold, continue the existing segment
-        if current_active_segment and (current_timestamp - current_active_segment["end_time"]) <= timedelta(
-            seconds=activity_threshold_seconds
-        ):
-            current_active_segment["end_time"] = current_timestamp
-
-        # Otherwise, start a new segment
-        else:
-            if current_active_segment:
-                active_recording_segments.append(current_active_segment)
-            current_active_segment = RecordingSegment(
-                start_time=current_timestamp, end_time=current_timestamp, window_id=window_id, is_active=True
-            )
-
-    # Add the active last segment if it hasn't already been added
-    if current_active_segment and (
-        len(active_recording_segments) == 0 or active_recording_segments[-1] != current_active_segment
-    ):
-        active_recording_segments.append(current_active_segment)
-
-    return active_recording_segments
+    # float64, as timestamps may have fractional milliseconds. Millisecond timestamps as ints are exact in float64
+    active_event_timestamps = np.fromiter(
+        (event["timestamp"] for event in event_list if is_active_event(event)), dtype=np.float64
+    )
+    if len(active_event_timestamps) == 0:
+        return []
+
+    # A new segment starts wherever the time since the last active event is more than the threshold
+    gap_indices = np.flatnonzero(np.diff(active_event_timestamps) > activity_threshold_seconds * 1000)
+    segment_start_timestamps = active_event_timestamps[np.r_[0, gap_indices + 1]]
+    segment_end_timestamps = active_event_timestamps[np.r_[gap_indices, len(active_event_timestamps) - 1]]
+
+    # Only build datetimes for the segment boundaries, not for every active event
+    return [
+        RecordingSegment(
+            start_time=parse_snapshot_timestamp(start_timestamp),
+            end_time=parse_snapshot_timestamp(end_timestamp),
+            window_id=window_id,
+            is_active=True,
+        )
+        for start_timestamp, end_timestamp in zip(segment_start_timestamps.tolist(), segment_end_timestamps.tolist())
+    ]
 
 
 def convert_to_timestamp(source: str) -> int:
@@ -356,21 +385,22 @@ def get_events_summary_from_snapshot_data(snapshot_data: List[SnapshotData]) ->
         if "timestamp" not in event or "type" not in event:
             continue
 
+        event_data = event.get("data") or {}
         # Get all top level data values
         data = {
             key: value
-            for key, value in event.get("data", {}).items()
-            if type(value) in [str, int] and key in EVENT_SUMMARY_DATA_INCLUSIONS
+            for key, value in event_data.items()
+            if key in EVENT_SUMMARY_DATA_KEYS and type(value) in (str, int)
         }
         # Some events have a payload, some values of which we want
-        if event.get("data", {}).get("payload"):
-            # Make sure the payload is a dict before we access it
-            if isinstance(event["data"]["payload"], dict):
-                data["payload"] = {
-                    key: value
-                    for key, value in event["data"]["payload"].items()
-                    if type(value) in [str, int] and f"payload.{key}" in EVENT_SUMMARY_DATA_INCLUSIONS
-                }
+        payload = event_data.get("payload")
+        # Make sure the payload is a dict before we access it
+        if payload and isinstance(payload, dict):
+            data["payload"] = {
+                key: value
+                for key, value in payload.items()
+                if key in EVENT_SUMMARY_PAYLOAD_KEYS and type(value) in (str, int)
+            } or EMPTY_EVENT_SUMMARY_DATA
 
         # noinspection PyBroadException
         try:
@@ -380,18 +410,24 @@ def get_events_summary_from_snapshot_data(snapshot_data: List[SnapshotData]) ->
                     if isinstance(event["timestamp"], (int, float))
                     else convert_to_timestamp(event["timestamp"]),
                     type=event["type"],
-                    data=data,
+                    data=data or EMPTY_EVENT_SUMMARY_DATA,
                 )
             )
         except ParserError:
             capture_exception()
 
     # No guarantees are made about order so, we sort here to be sure
-    events_summary.sort(key=lambda x: x["timestamp"])
+    events_summary.sort(key=itemgetter("timestamp"))
 
     return events_summary
 
 
+def sort_window_ids_by_start_time(
+    start_and_end_times_by_window_id: Dict[WindowId, RecordingSegment]
+) -> List[WindowId]:
+    return sorted(start_and_end_times_by_window_id, key=lambda x: start_and_end_times_by_window_id[x]["start_time"])
+
+
 def generate_inactive_segments_for_range(
     range_start_time: datetime,
     range_end_time: datetime,
@@ -399,16 +435,18 @@ def generate_inactive_segments_for_range(
     start_and_end_times_by_window_id: Dict[WindowId, RecordingSegment],
     is_first_segment: bool = False,
     is_last_segment: bool = False,
+    window_ids_by_start_time: Optional[List[WindowId]] = None,
 ) -> List[RecordingSegment]:
     """
     Given the start and end times of a known period of inactivity,
     this function will try create recording segments to fill the gap based on the
     start and end times of the given window_ids
+
+    Callers filling many gaps should pass `window_ids_by_start_time` so the window_ids are only sorted once
     """
 
-    window_ids_by_start_time = sorted(
-        start_and_end_times_by_window_id, key=lambda x: start_and_end_times_by_window_id[x]["start_time"]
-    )
+    if window_ids_by_start_time is None:
+        window_ids_by_start_time = sort_window_ids_by_start_time(start_and_end_times_by_window_id)
 
     # Order of window_ids to use for generating inactive segments. Start with the window_id of the
     # last active segment, then try the other window_ids in order of start_time